@@ -0,0 +1,378 @@
+"""
+Testes de regressão de migrate-posts.py: leitura do dump, conversão de conteúdo e carga.
+
+Uso:
+    python -m pytest scripts/test_migrate_posts.py
+    python -m unittest discover -s scripts -p 'test_*.py'
+"""
+
+import hashlib
+import importlib.util
+import io
+import os
+import re
+import sys
+import tempfile
+import unittest
+
+import mysql.connector
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrate-posts.py')
+
+spec = importlib.util.spec_from_file_location('migrate_posts', SCRIPT)
+migrate_posts = importlib.util.module_from_spec(spec)
+sys.modules.setdefault('migrate_posts', migrate_posts)
+spec.loader.exec_module(migrate_posts)
+
+
+# Corpo de post com tudo o que o dump precisa escapar
+BODY = "C:\\dir 'a' ''b'' \r\nx\ty\x00z"
+
+
+def dump_rows(dump, chunk_size):
+    reader = migrate_posts.SqlDumpReader(io.StringIO(dump), chunk_size=chunk_size)
+    return [row for _, row in reader.rows(tables={'posts'})]
+
+
+def convert(content, excerpt=None):
+    post = {'title': 'Título', 'slug': 'titulo', 'excerpt': excerpt, 'content': content}
+    return migrate_posts.transform_post(post, migrate_posts.DEFAULT_TRANSFORMS)
+
+
+class SqlDumpReaderTest(unittest.TestCase):
+    DUMP = (
+        "CREATE TABLE `posts` (\n  `id` int(11) NOT NULL,\n  `conteudo` text\n);\n"
+        "INSERT INTO `posts` VALUES (1,'C:\\\\dir \\'a\\' \\'\\'b\\'\\' \\r\\nx\\ty\\0z'),\n"
+        "(2,'C:\\\\dir ''a'' ''''b'''' \\r\\nx\\ty\\0z');\n"
+    )
+
+    def test_escapes_entre_blocos(self):
+        for chunk_size in (1, 2, 3, 5, 8, migrate_posts.DUMP_CHUNK_SIZE):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(dump_rows(self.DUMP, chunk_size), [
+                    {'id': 1, 'conteudo': BODY},
+                    {'id': 2, 'conteudo': BODY},
+                ])
+
+    def test_tab_e_quebra_de_linha_literais(self):
+        dump = "INSERT INTO `posts` (`id`, `conteudo`) VALUES (1,'x\ty\r\nz');\n"
+        self.assertEqual(dump_rows(dump, 2), [{'id': 1, 'conteudo': 'x\ty\r\nz'}])
+
+
+class MarkdownEscapeTest(unittest.TestCase):
+    def test_texto_que_parece_lista_numerada(self):
+        self.assertEqual(convert('<p>2024. Ano bom</p>')['content'], '2024\\. Ano bom')
+
+    def test_texto_que_parece_lista(self):
+        self.assertEqual(convert('<p>- nem isso</p>')['content'], '\\- nem isso')
+        self.assertEqual(convert('<p>+ nem isso</p>')['content'], '\\+ nem isso')
+
+    def test_texto_que_parece_titulo_ou_citacao(self):
+        self.assertEqual(convert('<p># não</p><p>&gt; nem</p>')['content'], '\\# não\n\n&gt; nem')
+
+    def test_sublinhado_e_colchetes(self):
+        self.assertEqual(convert('<p>__init__ e [x](y)</p>')['content'], '\\_\\_init\\_\\_ e \\[x\\](y)')
+
+    def test_marcador_depois_do_item_de_lista(self):
+        self.assertEqual(convert('<ul><li>2024. item</li></ul>')['content'], '- 2024\\. item')
+
+    def test_html_escapado_continua_texto(self):
+        result = convert('<p>Use &lt;img src=x onerror=alert(1)&gt; aqui</p>')
+        self.assertEqual(result['content'], 'Use &lt;img src=x onerror=alert(1)&gt; aqui')
+        self.assertEqual(result['excerpt'], 'Use <img src=x onerror=alert(1)> aqui')
+
+    def test_entidades_no_texto(self):
+        self.assertEqual(convert('<p>tag &lt;table&gt; e &amp;lt;</p>')['content'], 'tag &lt;table&gt; e &amp;lt;')
+
+    def test_exclamacao_antes_de_link(self):
+        self.assertEqual(convert('<p>!<a href="/i">x</a></p>')['content'], '\\![x](/i)')
+        self.assertEqual(convert('<p>Veja! <a href="/i">x</a></p>')['content'], 'Veja! [x](/i)')
+
+    def test_codigo_sem_escapes(self):
+        self.assertEqual(convert('<p>use <code>snake_case</code></p>')['content'], 'use `snake_case`')
+
+
+class EmphasisTest(unittest.TestCase):
+    def test_espaco_fica_fora_do_negrito(self):
+        result = convert('<p><strong>Processos manuais </strong>e lentos</p>')
+        self.assertEqual(result['content'], '**Processos manuais** e lentos')
+
+    def test_espaco_inicial_fica_fora_do_italico(self):
+        self.assertEqual(convert('<p>muito<em> lento</em></p>')['content'], 'muito *lento*')
+
+    def test_enfase_vazia_e_descartada(self):
+        self.assertEqual(convert('<p>a<b></b>b <em> </em>c</p>')['content'], 'ab c')
+
+
+class TableTest(unittest.TestCase):
+    def test_tabela_gfm(self):
+        result = convert('<table><tr><th>a</th><th>b</th></tr><tr><td>1|2</td><td>3</td></tr></table>')
+        self.assertEqual(result['content'], '| a | b |\n| --- | --- |\n| 1\\|2 | 3 |')
+
+    def test_celulas_sem_fechamento(self):
+        result = convert('<table><tr><td>a<td>b<tr><td>c</table>')
+        self.assertEqual(result['content'], '| a | b |\n| --- | --- |\n| c |  |')
+
+
+class PlainTextTest(unittest.TestCase):
+    def test_mantem_caracteres_do_texto(self):
+        self.assertEqual(migrate_posts.plain_text('snake\\_case e 2\\*3'), 'snake_case e 2*3')
+        self.assertEqual(migrate_posts.plain_text('snake_case'), 'snake_case')
+
+    def test_tira_a_marcacao(self):
+        text = '## Título\n\n**negrito** e *itálico* com [link](/x) e `código`\n\n- item'
+        self.assertEqual(migrate_posts.plain_text(text), 'Título negrito e itálico com link e código item')
+
+    def test_tira_tabelas(self):
+        self.assertEqual(migrate_posts.plain_text('| a | b |\n| --- | --- |\n| 1 | 2 |'), 'a b 1 2')
+
+    def test_resumo_gerado_do_markdown(self):
+        result = convert('<p><strong>2024. </strong>snake_case e 2*3</p>')
+        self.assertEqual(result['excerpt'], '2024. snake_case e 2*3')
+
+    def test_termos_de_busca(self):
+        self.assertEqual(migrate_posts.search_terms('2\\*3 sem_escape'), {'sem', 'escape'})
+
+    def test_termos_saem_do_transform(self):
+        post = {'title': 'Ação', 'slug': 'acao', 'excerpt': None, 'content': '<p>Fluxo <b>de</b> caixa</p>'}
+        result = migrate_posts.transform_post(post, migrate_posts.DEFAULT_TRANSFORMS, search=True)
+        self.assertEqual(result['terms'], ['acao', 'caixa', 'de', 'fluxo'])
+
+    def test_termos_sem_estagios(self):
+        post = {'title': 'Ação', 'slug': 'acao', 'excerpt': None, 'content': 'Fluxo de caixa', 'legacy_id': 1}
+        result, = migrate_posts.iter_transformed([post], (), search=True)
+        self.assertEqual(result['terms'], ['acao', 'caixa', 'de', 'fluxo'])
+        self.assertEqual(result['legacy_id'], 1)
+
+
+class LegacyCategoryTest(unittest.TestCase):
+    def test_categoria_pelo_id(self):
+        post = migrate_posts.legacy_post({'titulo': 'A', 'categoria_id': '5'})
+        slug_by_id = dict(migrate_posts.CATEGORY_SLUGS)
+        self.assertEqual(migrate_posts.category_slug(post['category_id'], slug_by_id), 'fidc')
+
+    def test_categoria_pelo_nome_ou_slug(self):
+        slug_by_id = dict(migrate_posts.CATEGORY_SLUGS)
+        for value in ('Fluxo de Caixa', 'fluxo-de-caixa'):
+            post = migrate_posts.legacy_post({'titulo': 'A', 'categoria': value})
+            self.assertEqual(migrate_posts.category_slug(post['category_id'], slug_by_id), 'fluxo-de-caixa')
+
+    def test_categoria_desconhecida(self):
+        post = migrate_posts.legacy_post({'titulo': 'A', 'categoria': 'Sem Categoria'})
+        slug_by_id = dict(migrate_posts.CATEGORY_SLUGS)
+        self.assertEqual(migrate_posts.category_slug(post['category_id'], slug_by_id),
+                         migrate_posts.DEFAULT_CATEGORY_SLUG)
+
+
+class BrokenStorage:
+    name = 'quebrado'
+
+    def put(self, key, data, content_type):
+        raise OSError("disco cheio")
+
+
+class ImageMigratorTest(unittest.TestCase):
+    def test_falha_fora_do_storage_nao_trava_as_imagens_iguais(self):
+        with tempfile.TemporaryDirectory() as uploads:
+            for name in ('a.png', 'b.png'):
+                with open(os.path.join(uploads, name), 'wb') as fh:
+                    fh.write(b'mesmos bytes')
+            migrator = migrate_posts.ImageMigrator(uploads, BrokenStorage(), workers=2)
+            post = {'content': '![](/a.png) ![](/b.png)', 'image': None}
+            refs = migrator.submit(post)
+            for src, _ in refs:
+                self.assertIsNone(migrator._by_ref[src].result(timeout=5))
+            migrator.apply(post, refs)
+            migrator.close()
+            self.assertEqual(post['gallery'], [])
+            self.assertEqual(len(migrator.failed), 1)
+            self.assertIsInstance(migrator.failed[0][1], OSError)
+
+
+# Como o LOAD DATA lê cada campo com ESCAPED BY '\\'
+LOAD_DATA_ESCAPES = {'0': '\x00', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t', 'Z': '\x1a'}
+
+
+def load_data_field(field):
+    if field == '\\N':
+        return None
+    out = []
+    chars = iter(field)
+    for char in chars:
+        if char == '\\':
+            char = next(chars)
+            char = LOAD_DATA_ESCAPES.get(char, char)
+        out.append(char)
+    return ''.join(out)
+
+
+class TsvFieldTest(unittest.TestCase):
+    def test_escapes(self):
+        self.assertEqual(migrate_posts.tsv_field(BODY), "C:\\\\dir 'a' ''b'' \\r\\nx\\ty\\0z")
+
+    def test_ida_e_volta(self):
+        values = (BODY, None, 'N', '\\N', 'fim\\', True, 7)
+        line = '\t'.join(migrate_posts.tsv_field(value) for value in values) + '\n'
+        self.assertNotIn('\n', line[:-1])
+        self.assertNotIn('\r', line)
+        fields = [load_data_field(field) for field in line[:-1].split('\t')]
+        self.assertEqual(fields, [BODY, None, 'N', '\\N', 'fim\\', '1', '7'])
+
+
+class FakeBulkCursor:
+    """Cursor que simula posts_staging o bastante para bulk_load_posts."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+        self.warning_count = 0
+        self._result = []
+
+    def execute(self, statement, params=()):
+        self.rowcount = 0
+        self.warning_count = 0
+        self._result = []
+        staging = self.conn.staging
+        if 'LOAD DATA' in statement:
+            with open(params[0], encoding='utf-8') as tsv:
+                for line in tsv:
+                    fields = line.rstrip('\n').split('\t')
+                    staging[int(fields[0])] = fields
+            self.rowcount = len(staging)
+            self.warning_count = len(self.conn.warnings)
+        elif statement == 'SHOW WARNINGS':
+            self._result = [('Warning', 1265, message) for message in self.conn.warnings]
+        elif 'WHERE seq IN' in statement:
+            seqs = [int(seq) for seq in statement.split('(')[-1].rstrip(')').split(',')]
+            if statement.startswith('DELETE'):
+                self.rowcount = sum(staging.pop(seq, None) is not None for seq in seqs)
+            else:
+                self._result = [(seq, staging[seq][2]) for seq in seqs if seq in staging]
+        elif 'INSERT INTO posts' in statement:
+            first, last = params
+            if first in self.conn.failing:
+                raise mysql.connector.Error("Data too long for column 'content'", errno=1406)
+            self.conn.applied += [staging[seq][2] for seq in sorted(staging) if first <= seq <= last]
+        elif statement.startswith('SELECT slug'):
+            first, last = params
+            self._result = [(staging[seq][2],) for seq in sorted(staging) if first <= seq <= last]
+
+    def fetchall(self):
+        return self._result
+
+    def close(self):
+        pass
+
+
+class FakeBulkConnection:
+    def __init__(self, warnings=(), failing=()):
+        self.warnings = list(warnings)
+        self.failing = set(failing)
+        self.staging = {}
+        self.applied = []
+
+    def cursor(self):
+        return FakeBulkCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakeState:
+    def next_batch(self):
+        return 1
+
+
+def post_row(slug, title='Título', content='texto'):
+    return slug, (title, slug, None, content, None, True)
+
+
+class BulkLoadTest(unittest.TestCase):
+    def load(self, conn, rows, batch_size=10):
+        return migrate_posts.bulk_load_posts(conn, rows, {}, FakeState(), batch_size, 1 << 20)
+
+    def test_linha_maior_que_a_coluna_fica_fora_do_staging(self):
+        conn = FakeBulkConnection()
+        rows = [post_row('a'), post_row('b', title='x' * 256), post_row('c', content='é' * 40000)]
+        loaded, rejected = self.load(conn, rows)
+        self.assertEqual(loaded, 1)
+        self.assertEqual(conn.applied, ['a'])
+        self.assertEqual([slug for slug, _ in rejected], ['b', 'c'])
+
+    def test_linha_truncada_pelo_load_data_e_rejeitada(self):
+        conn = FakeBulkConnection(warnings=["Data truncated for column 'excerpt' at row 2"])
+        loaded, rejected = self.load(conn, [post_row('a'), post_row('b'), post_row('c')])
+        self.assertEqual(loaded, 2)
+        self.assertEqual(conn.applied, ['a', 'c'])
+        self.assertEqual([slug for slug, _ in rejected], ['b'])
+
+    def test_erro_numa_faixa_nao_interrompe_a_carga(self):
+        conn = FakeBulkConnection(failing={1})
+        rows = [post_row(slug) for slug in 'abcd']
+        loaded, rejected = self.load(conn, rows, batch_size=2)
+        self.assertEqual(loaded, 4)
+        self.assertEqual(conn.applied, ['c', 'd'])
+        self.assertEqual([slug for slug, _ in rejected], ['a', 'b'])
+
+
+
+class SqlLiteralTest(unittest.TestCase):
+    def test_escapes(self):
+        self.assertEqual(migrate_posts.sql_literal(BODY), "'C:\\\\dir \\'a\\' \\'\\'b\\'\\' \\r\\nx\ty\\0z'")
+        self.assertEqual(migrate_posts.sql_literal('\x1a'), "'\\Z'")
+
+    def test_valores_simples(self):
+        self.assertEqual(migrate_posts.sql_literal(None), 'NULL')
+        self.assertEqual(migrate_posts.sql_literal(True), '1')
+        self.assertEqual(migrate_posts.sql_literal(7), '7')
+
+    def test_ida_e_volta_pelo_leitor_do_dump(self):
+        values = (BODY, 'fim\\', "'", None)
+        dump = 'INSERT INTO `posts` (`a`, `b`, `c`, `d`) VALUES ({});\n'.format(
+            ','.join(migrate_posts.sql_literal(value) for value in values)
+        )
+        self.assertEqual(dump_rows(dump, 3), [dict(zip('abcd', values))])
+
+
+# Termos do CONCAT_WS de POST_CHECKSUM_SQL: IFNULL(SHA2(coluna, 256), '-') ou IFNULL(coluna, '-')
+CHECKSUM_TERM = re.compile(r"IFNULL\((?:SHA2\((?P<hashed>\w+), 256\)|(?P<raw>\w+)), '-'\)")
+
+
+def sql_checksum(row):
+    """Avalia em Python a expressão de POST_CHECKSUM_SQL, como o MySQL faria, para a linha."""
+    parts = []
+    for match in CHECKSUM_TERM.finditer(migrate_posts.POST_CHECKSUM_SQL):
+        value = row[match.group('hashed') or match.group('raw')]
+        if value is None:
+            parts.append('-')
+        elif match.group('hashed'):
+            parts.append(hashlib.sha256(value.encode('utf-8')).hexdigest())
+        else:
+            parts.append(str(value))
+    return hashlib.sha256(':'.join(parts).encode('utf-8')).hexdigest()
+
+
+class RowChecksumTest(unittest.TestCase):
+    def test_mesmo_checksum_que_o_sql(self):
+        self.assertEqual(len(CHECKSUM_TERM.findall(migrate_posts.POST_CHECKSUM_SQL)), 4)
+        rows = (
+            {'title': 'Ação', 'excerpt': None, 'content': BODY, 'categoryId': 3},
+            {'title': 'A', 'excerpt': 'resumo: com dois pontos', 'content': '', 'categoryId': None},
+        )
+        for row in rows:
+            with self.subTest(row=row):
+                self.assertEqual(
+                    migrate_posts.row_checksum(row['title'], row['excerpt'], row['content'], row['categoryId']),
+                    sql_checksum(row),
+                )
+
+    def test_campos_trocados_mudam_o_checksum(self):
+        checksum = migrate_posts.row_checksum('a', None, 'b', 1)
+        self.assertNotEqual(checksum, migrate_posts.row_checksum('b', None, 'a', 1))
+        self.assertNotEqual(checksum, migrate_posts.row_checksum('a', '', 'b', 1))
+
+if __name__ == '__main__':
+    unittest.main()